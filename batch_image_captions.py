@@ -3,35 +3,81 @@ Batch Image Captions
 Author: Sheli Kohan
 Date: 12th June 2023
 """
+import asyncio
+import aiohttp
 import torch
-from multiprocessing import Queue, get_context
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
 import threading
 from image_caption_processor import ImageCaptionProcessor
+from image_with_caption import ImageWithCaption
 
 
 class BatchImageCaptions:
     """
-    Class for batch processing image captions using multiple threads.
+    Class for batch processing image captions using asynchronous downloads.
     """
 
-    def __init__(self, n_cpus: int = 4, q_len: int = 2, batch_size: int = 64, **kwargs):
+    def __init__(self, n_cpus: int = 4, q_len: int = 4, batch_size: int = 64, **kwargs):
         """
         Initializes the BatchImageCaptions.
 
         Args:
-            n_cpus (int): The number of CPUs to use for parallel processing.
-            q_len (int): The maximum length of the processing queue.
+            n_cpus (int): The number of CPUs to use for parallel image decoding.
+            q_len (int): The maximum number of downloaded batches staged ahead of caption
+                generation. Keeping at least two batches in flight hides download latency
+                behind GPU compute.
             batch_size (int): The number of images to process in each batch.
             **kwargs: Additional keyword arguments to be passed to the ImageCaptionProcessor.
         """
         self.n_cpus = n_cpus
-        self.pool = None
-        self.is_pool_closed = True
         self.processor = ImageCaptionProcessor(**kwargs)
+        self.decode_pool = ThreadPoolExecutor(max_workers=n_cpus)
+        self.caption_cache = {}
         self.queue = Queue(q_len)
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
         self.batch_size = batch_size
 
+    async def __fetch_image(self, session: aiohttp.ClientSession, image_url: str, idx: int) -> ImageWithCaption:
+        """
+        Downloads a single image over a shared HTTP session and decodes it off the event loop.
+
+        Args:
+            session (aiohttp.ClientSession): The shared HTTP session with connection pooling.
+            image_url (str): The URL of the image.
+            idx (int): The index of the image within the full URL list.
+
+        Returns:
+            ImageWithCaption: The metadata of the downloaded image.
+        """
+        if image_url in self.caption_cache:
+            return ImageWithCaption(url=image_url, is_valid=True, idx=idx, image=None,
+                                    caption=self.caption_cache[image_url])
+        try:
+            async with session.get(image_url) as response:
+                image_bytes = await response.read()
+        except Exception as e:
+            print(str(e))
+            return ImageWithCaption(url=image_url, is_valid=False, idx=idx, image=None)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.decode_pool, self.processor.get_image_from_bytes,
+                                          image_bytes, image_url, idx)
+
+    async def __download_images(self, image_urls_ls: list):
+        """
+        Downloads all images batch by batch, putting each finished batch on the processing queue.
+
+        Args:
+            image_urls_ls (list): A list of image URLs.
+        """
+        connector = aiohttp.TCPConnector(limit=self.n_cpus * 8, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            for i in range(0, len(image_urls_ls), self.batch_size):
+                image_urls_batch = image_urls_ls[i:i + self.batch_size]
+                processed_images = await asyncio.gather(
+                    *[self.__fetch_image(session, url, idx) for idx, url in enumerate(image_urls_batch, start=i)])
+                self.queue.put(processed_images)
+
     def __add_images_to_queue(self, image_urls_ls: list):
         """
         Adds image URLs to the processing queue.
@@ -39,11 +85,7 @@ class BatchImageCaptions:
         Args:
             image_urls_ls (list): A list of image URLs.
         """
-        for i in range(0, len(image_urls_ls), self.batch_size):
-            image_urls_batch = image_urls_ls[i:i + self.batch_size]
-            img_urls2idx = [(url, i) for i, url in enumerate(image_urls_batch)]
-            processed_images = self.pool.starmap(self.processor.get_image_from_url, img_urls2idx)
-            self.queue.put(processed_images)
+        asyncio.run(self.__download_images(image_urls_ls))
 
     def __str__(self):
         return f'{self.n_cpus},{self.batch_size},{self.device},{str(self.processor)}'
@@ -58,33 +100,36 @@ class BatchImageCaptions:
         Returns:
             list: A list of ImageWithCaption objects containing the generated captions.
         """
-        if self.is_pool_closed:
+        if self.decode_pool is None:
             self.open_pool()
         thread = threading.Thread(target=self.__add_images_to_queue, args=(image_urls_ls,))
         thread.start()
-        all_images = []
+        all_images = [None] * len(image_urls_ls)
         while True:
             images = self.queue.get()
-            valid_images = [image for image in images if image.is_valid]
-            self.processor.add_image_captions(valid_images)
-            all_images += images
+            valid_images = [image for image in images if image.is_valid and image.caption is None]
+            if valid_images:
+                self.processor.add_image_captions(valid_images, pad_to=self.batch_size)
+            for image in valid_images:
+                self.caption_cache[image.url] = image.caption
+            for image in images:
+                image.image = None
+                all_images[image.idx] = image
             if not thread.is_alive() and self.queue.empty():
                 break
         return all_images
 
     def open_pool(self):
         """
-        Opens the thread pool for parallel processing.
+        Opens the thread pool used for image decoding.
         """
-        ctx = get_context('spawn')
-        self.pool = ctx.Pool(self.n_cpus)
-        self.is_pool_closed = False
+        self.decode_pool = ThreadPoolExecutor(max_workers=self.n_cpus)
 
     def close_pool(self):
         """
-        Closes the thread pool.
+        Closes the thread pool used for image decoding. It is reopened lazily on the next
+        call to get_image_captions_from_urls.
         """
-        if not self.is_pool_closed:
-            self.pool.close()
-            self.pool.join()
-            self.is_pool_closed = True
+        if self.decode_pool is not None:
+            self.decode_pool.shutdown(wait=True)
+            self.decode_pool = None
@@ -1,5 +1,4 @@
 import os
-import glob
 import json
 import pickle
 import subprocess
@@ -12,20 +11,20 @@ def makedirs_if_not_exists(path):
     os.makedirs(directory, exist_ok=True)
 
 
+def iter_sub_files(directory):
+    for entry in os.scandir(directory):
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_sub_files(entry.path)
+        else:
+            yield entry.path
+
+
 def get_all_sub_files(directory):
-    file_list = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_list.append(file_path)
-    return file_list
+    return list(iter_sub_files(directory))
 
 
 def extract_csv_files(directory):
-    csv_files = []
-    for root, dirs, files in os.walk(directory):
-        csv_files.extend(glob.glob(os.path.join(root, '*.csv')))
-    return csv_files
+    return [path for path in iter_sub_files(directory) if path.endswith('.csv')]
 
 
 class FileHandler(ABC):
@@ -72,6 +71,13 @@ class FileHandler(ABC):
         self.save(self.data)
 
 def get_gpu_memory_usage():
+    try:
+        import torch
+        if torch.cuda.is_available():
+            free, total = torch.cuda.mem_get_info()
+            return [(total - free) // 2 ** 20]
+    except ImportError:
+        pass
     try:
         output = subprocess.check_output(['nvidia-smi', '--query-gpu=memory.used', '--format=csv,nounits,noheader'])
         memory_used = [int(x) for x in output.decode().strip().split('\n')]
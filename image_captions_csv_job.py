@@ -1,8 +1,9 @@
 from typing import List
 
 from image_captions_job import ImageCaptionsJobManager
-import csv
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv
 import argparse
 
 
@@ -35,12 +36,10 @@ class CSVImageCaptionsJobManager(ImageCaptionsJobManager):
         self.picture_description_column = picture_description_column
 
     def save_batch(self, bid, writer, batch):
-        if bid == 1:
-            writer.writerow(batch.columns)
-        writer.writerows(batch.values)
+        batch.to_csv(writer, header=bid == 1, index=False)
 
     def get_writer(self, out_file):
-        return csv.writer(out_file)
+        return out_file
 
     def get_batch_picture_urls(self, batch: pd.DataFrame) -> List[str]:
         """
@@ -70,7 +69,10 @@ class CSVImageCaptionsJobManager(ImageCaptionsJobManager):
 
     def _iter_batches(self, file_path):
         """
-        Iterate through the CSV file in batches.
+        Iterate through the CSV file in batches using pyarrow's streaming reader.
+
+        Arrow parses the CSV columnar and multithreaded, and the record batches are
+        re-sliced to exactly batch_size rows so resume bookkeeping stays consistent.
 
         Args:
             file_path (str): Path to the input CSV file.
@@ -79,8 +81,21 @@ class CSVImageCaptionsJobManager(ImageCaptionsJobManager):
             pd.DataFrame: A batch of data from the CSV file.
 
         """
-        for batch in pd.read_csv(file_path, chunksize=self.bic.batch_size):
-            yield batch
+        batch_size = self.bic.batch_size
+        leftover = None
+        with pyarrow.csv.open_csv(file_path) as reader:
+            for record_batch in reader:
+                table = pa.Table.from_batches([record_batch])
+                if leftover is not None:
+                    table = pa.concat_tables([leftover, table])
+                    leftover = None
+                while table.num_rows >= batch_size:
+                    yield table.slice(0, batch_size).to_pandas()
+                    table = table.slice(batch_size)
+                if table.num_rows:
+                    leftover = table
+        if leftover is not None:
+            yield leftover.to_pandas()
 
 
 class ABNBImageCaptionsJobManager(CSVImageCaptionsJobManager):
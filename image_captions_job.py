@@ -3,6 +3,7 @@ Image Captions Job
 Author: Sheli Kohan
 Date: 12th June 2023
 """
+import json
 import os
 import time
 from typing import List
@@ -44,6 +45,46 @@ class ImageCaptionsJobManager(ABC):
         self.logger = FileLogger(self.logger_name, logger_path)
         self.bic = BatchImageCaptions(**kwargs)
         self.status = JsonFileHandler(file_processing_status_path, {})
+        self.status_log_path = file_processing_status_path + '.jsonl'
+        self.__replay_status_log()
+        self.status_log = open(self.status_log_path, 'a')
+
+    def __replay_status_log(self):
+        """
+        Replays per-batch delta lines appended since the last full snapshot, so a crashed
+        run resumes from the exact batch it reached rather than the last snapshot. A torn
+        final line from a crash mid-write is skipped instead of failing startup.
+        """
+        try:
+            with open(self.status_log_path) as log_file:
+                for line in log_file:
+                    try:
+                        delta = json.loads(line)
+                    except json.JSONDecodeError:
+                        self.logger.warning("Skipping torn line in the batch status log.")
+                        continue
+                    pid = self.get_processing_id(delta["file_path"], delta["out_path"])
+                    f_status = self.status.data.setdefault(
+                        pid, self.get_new_file_info(delta["file_path"], delta["out_path"]))
+                    self.__apply_batch_delta(f_status, delta)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def __apply_batch_delta(f_status: dict, delta: dict):
+        """
+        Folds one per-batch delta line into a file's status.
+        """
+        f_status["n_batches"] += 1
+        for key in ("gpu_usage", "cpu_usage", "ram_usage", "iter_time"):
+            f_status[key].append(delta[key])
+
+    def __compact_status_log(self):
+        """
+        Writes a full status snapshot and truncates the append-only batch log.
+        """
+        self.status.save_data()
+        self.status_log.truncate(0)
 
     def get_processing_id(self, file_path: str, out_path: str) -> str:
         """
@@ -69,7 +110,7 @@ class ImageCaptionsJobManager(ABC):
         pid = self.get_processing_id(file_path, out_path)
         f_status = self.status.data.get(pid, self.get_new_file_info(file_path, out_path))
         if self.validate_processing(f_status):
-            with open(out_path, 'a', newline='', encoding='utf-8') as out_file:
+            with open(out_path, 'a', newline='', encoding='utf-8', buffering=1 << 20) as out_file:
                 self.status.data[pid] = f_status
                 writer = self.get_writer(out_file)
                 for bid, batch in enumerate(self._iter_batches(file_path), start=1):
@@ -77,7 +118,7 @@ class ImageCaptionsJobManager(ABC):
                         self.process_batch(bid, batch, f_status, writer)
             f_status["is_done"] = True
             self.logger.info(f"Finished gracefully {file_path} with {bid} batches.")
-            self.status.save_data()
+            self.__compact_status_log()
 
     @abstractmethod
     def get_writer(self, out_file):
@@ -150,12 +191,12 @@ class ImageCaptionsJobManager(ABC):
             f_status (dict): File processing status.
             elapsed_time (float): Elapsed time for the batch.
         """
-        f_status["n_batches"] += 1
-        f_status["gpu_usage"].append(get_gpu_memory_usage())
-        f_status["cpu_usage"].append(get_cpu_memory_usage())
-        f_status["ram_usage"].append(get_ram_usage())
-        f_status["iter_time"].append(elapsed_time)
-        self.status.save_data()
+        delta = {"file_path": f_status["file_path"], "out_path": f_status["out_path"],
+                 "gpu_usage": get_gpu_memory_usage(), "cpu_usage": get_cpu_memory_usage(),
+                 "ram_usage": get_ram_usage(), "iter_time": elapsed_time}
+        self.__apply_batch_delta(f_status, delta)
+        self.status_log.write(json.dumps(delta) + '\n')
+        self.status_log.flush()
 
     def process_file(self, file_path: str, out_path: str):
         """
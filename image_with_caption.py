@@ -51,5 +51,7 @@ class ImageWithCaption:
         """
         if self.is_valid:
             original_width, original_height = self.image.size
+            if original_width == resize_width:
+                return self.image
             show_height = int((original_height / original_width) * resize_width)
-            return self.image.resize((resize_width, show_height))
+            return self.image.resize((resize_width, show_height), resample=Image.Resampling.BILINEAR)
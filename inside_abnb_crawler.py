@@ -1,16 +1,65 @@
 import os
 import time
 import shutil
-import gzip
+try:
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
 import requests
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from urllib.parse import quote
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from file_logger import FileLogger
 from abc import ABC, abstractmethod
 import file_utils
 import argparse
 
 
+@lru_cache(maxsize=None)
+def listing_local_sub_path(url):
+    """
+    Build the relative local path for a listings CSV URL.
+
+    The mapping is pure string work on a fixed URL structure, so repeated URLs are
+    served from the cache instead of re-splitting and re-joining.
+
+    Args:
+        url (str): URL of the CSV file.
+
+    Returns:
+        str: Relative path under the parent directory.
+    """
+    sub_categories = url.split("/")[3:-2]
+    return os.path.join(*sub_categories, f"{'.'.join(sub_categories)}.csv")
+
+
+def download_gz_csv(url, local_path, session=None):
+    """
+    Download a gzipped CSV and store it decompressed at local_path.
+
+    The data streams into a .part file that is renamed over local_path only once the
+    download completes, so an interrupted run never leaves a truncated CSV that the
+    existing-file filter would skip. Module-level so a process pool can pickle it;
+    workers without a session fall back to plain requests.
+
+    Args:
+        url (str): URL of the gzipped CSV file.
+        local_path (str): Local path to save the CSV file.
+        session (requests.Session, optional): Session to reuse pooled connections.
+    """
+    get = session.get if session is not None else requests.get
+    temp_path = local_path + '.part'
+    with get(url, stream=True, timeout=(10, 60), headers={"Accept-Encoding": "gzip, deflate"}) as response:
+        response.raw.decode_content = False
+        with open(temp_path, 'wb', buffering=1024 * 1024) as f:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            with gzip.GzipFile(fileobj=response.raw, mode='rb') as gzipped_file:
+                shutil.copyfileobj(gzipped_file, f, length=262144)
+    os.replace(temp_path, local_path)
+
+
 class InsideABNBCrawler(ABC):
     """
     Base class for Inside Airbnb crawlers.
@@ -18,13 +67,21 @@ class InsideABNBCrawler(ABC):
     inside_airbnb_url = "http://insideairbnb.com/get-the-data/"
     logger_name = "iabnb_crawler"
 
-    def __init__(self, log_path, parent_dir):
+    def __init__(self, log_path, parent_dir, n_workers=8, use_processes=False):
         self.logger = FileLogger(self.logger_name, log_path)
         self.start_time = time.time()
         self.parent_dir = parent_dir
+        self.n_workers = n_workers
+        self.use_processes = use_processes
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=n_workers, pool_maxsize=n_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.index_cache_path = log_path + '.index.html'
+        self.index_meta_path = log_path + '.index.json'
         self.csv_urls = []
         self.url2local_path = []
-        self.soup = None
+        self.tree = None
         self.response = None
 
     def run(self):
@@ -38,15 +95,18 @@ class InsideABNBCrawler(ABC):
         self.download_csvs()
 
     def makedirs_by_urls(self):
-        for url, local_path in self.url2local_path:
-            file_utils.makedirs_if_not_exists(local_path)
+        directories = {os.path.dirname(local_path) for url, local_path in self.url2local_path}
+        for directory in directories:
+            os.makedirs(directory, exist_ok=True)
 
     def filter_existing_csvs(self):
         """
         Filter existing CSV files to avoid duplicate downloads.
         """
-        # TODO implement
-        pass
+        n_urls = len(self.url2local_path)
+        self.url2local_path = [(url, local_path) for url, local_path in self.url2local_path
+                               if not (os.path.exists(local_path) and os.path.getsize(local_path) > 0)]
+        self.logger.info(f"Skipping {n_urls - len(self.url2local_path)} already downloaded CSVs")
 
     def url_is_valid(self, url):
         return True
@@ -62,26 +122,70 @@ class InsideABNBCrawler(ABC):
         """
         pass
 
+    def __get_index_page(self):
+        """
+        Fetch the index page with a conditional GET, serving the cached copy on 304.
+
+        The ETag/Last-Modified of the last fetch live in a sidecar JSON next to the log,
+        so reruns skip re-downloading the multi-MB page when it has not changed.
+
+        Returns:
+            bytes: The HTML of the index page.
+        """
+        meta = file_utils.JsonFileHandler(self.index_meta_path, {}, logger=self.logger)
+        headers = {}
+        if os.path.exists(self.index_cache_path):
+            if "etag" in meta.data:
+                headers["If-None-Match"] = meta.data["etag"]
+            if "last_modified" in meta.data:
+                headers["If-Modified-Since"] = meta.data["last_modified"]
+        self.response = self.session.get(self.inside_airbnb_url, headers=headers)
+        if self.response.status_code == 304:
+            self.logger.info("Index page unchanged, using the cached copy.")
+            with open(self.index_cache_path, 'rb') as f:
+                return f.read()
+        content = self.response.content
+        with open(self.index_cache_path, 'wb') as f:
+            f.write(content)
+        meta.data = {}
+        if self.response.headers.get("ETag"):
+            meta.data["etag"] = self.response.headers["ETag"]
+        if self.response.headers.get("Last-Modified"):
+            meta.data["last_modified"] = self.response.headers["Last-Modified"]
+        meta.save_data()
+        return content
+
     def crawl_valid_urls(self):
         """
         Crawl the Inside Airbnb website to extract valid CSV file URLs.
         """
-        self.response = requests.get(self.inside_airbnb_url)
-        self.soup = BeautifulSoup(self.response.text, "html.parser")
+        self.tree = LexborHTMLParser(self.__get_index_page())
         for url in self.iter_urls():
             if self.url_is_valid(url):
-                self.logger.info(f"Valid URL {url}")
                 self.csv_urls.append(url)
             else:
                 self.logger.error(f"Invalid URL {url}")
+        self.logger.info(f"Found {len(self.csv_urls)} valid CSV URLs")
 
     def download_csvs(self):
         """
-        Download the CSV files from the URLs and save them locally.
+        Download the CSV files from the URLs concurrently and save them locally.
+
+        Threads fit the usual network-bound case; use_processes sidesteps the GIL
+        when gunzip is the bottleneck on a fast link.
         """
-        for url, local_path in self.url2local_path:
-            print(url)
-            self.download_csv_from_gz_url(url, local_path)
+        if self.use_processes:
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                futures = [executor.submit(download_gz_csv, url, local_path)
+                           for url, local_path in self.url2local_path]
+                for future in futures:
+                    future.result()
+            return
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            futures = [executor.submit(self.download_csv_from_gz_url, url, local_path)
+                       for url, local_path in self.url2local_path]
+            for future in futures:
+                future.result()
 
     def download_csv_from_gz_url(self, url, local_path):
         """
@@ -92,12 +196,7 @@ class InsideABNBCrawler(ABC):
             local_path (str): Local path to save the CSV file.
         """
         self.logger.info(f"trying to download {url}")
-        response = requests.get(url, stream=True)
-        with open(local_path, 'wb') as f:
-            with gzip.GzipFile(fileobj=response.raw) as gzipped_file:
-                shutil.copyfileobj(gzipped_file, f)
-
-        response.close()
+        download_gz_csv(url, local_path, session=self.session)
         self.logger.info(f"{url} file downloaded and saved successfully to {local_path}")
 
     @abstractmethod
@@ -116,21 +215,17 @@ class InsideABNBCrawler(ABC):
 
 class IABNBListingsCrawler(InsideABNBCrawler):
     listing_pattern = "http://data.insideairbnb.com/*data/listings.csv"
-    invalid_str_for_extraction = ["href", "Summary", "GIS files", "GeoJSON", "Review", "Calendar", "Listing data",
-                                  "Listings data"]
 
     def iter_urls(self):
-        for tag in set(self.soup.find_all("td", string=self.soup.find_all("td", string=self.listing_pattern))):
-            tag_str = str(tag)
-            self.logger.info(f"analyzing tag {tag_str}")
-            if not any(substring in tag_str for substring in self.invalid_str_for_extraction):
-                url = tag.nextSibling.contents[0].attrs["href"]
-                yield url[:5] + quote(url[5:].encode('latin-1').decode('utf-8'))
+        cells = self.tree.css("td")
+        for cell, link_cell in zip(cells, cells[1:]):
+            if cell.text(deep=True) != self.listing_pattern or cell.css_first("a") is not None:
+                continue
+            url = link_cell.css_first("a").attributes["href"]
+            yield quote(url, safe=':/')
 
     def get_local_path(self, url):
-        url_info = url.split("/")
-        sub_categories = url_info[3:-2]
-        return os.path.join(*[self.parent_dir] + sub_categories + [f"{'.'.join(sub_categories)}.csv"])
+        return os.path.join(self.parent_dir, listing_local_sub_path(url))
 
 
 def main(log_path, parent_dir):